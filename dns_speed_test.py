@@ -1,15 +1,41 @@
 # This tool is designed for IPv4 (A record) testing only.
 
+import asyncio
+import dns.asyncquery
+import dns.asyncresolver
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rdatatype
 import dns.resolver
 import time
-import statistics
 import argparse
 import json
 import csv
 import sys
+import os
 import shutil
-import ipaddress
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import signal
+import socket
+import struct
+import threading
+import queue
+from collections import deque
+from importlib.util import find_spec
+from functools import lru_cache
+from operator import itemgetter
+from pathlib import Path
+
+try:
+    import uvloop # Optional: a faster, libuv-based event loop
+except ImportError:
+    uvloop = None
+
+try:
+    import orjson # Optional: a faster JSON serializer
+except ImportError:
+    orjson = None
 
 # --- ANSI Color Codes for Terminal Output ---
 class Colors:
@@ -40,31 +66,108 @@ DEFAULT_DOMAINS = [
     "cloudflare.com", "amazon.com", "github.com", "wikipedia.org", "archlinux.org"
 ]
 RELIABILITY_THRESHOLD = 0.95 # Minimum success rate to be considered reliable
+DNS_PORT = 53
+QUERY_WINDOW = 32 # Default for --window: timed queries in flight to a single server
+SYSTEM_RESOLVER = "system" # Server label used by --engine getaddrinfo
+TXID_BATCH = 1024 # Random transaction IDs drawn per os.urandom call
+PROGRESS_INTERVAL = 0.1 # Minimum seconds between progress bar redraws
+
+# --- Streaming Latency Statistics ---
+class LatencyHistogram:
+    """HDR-style log-linear latency histogram: ~0.1% quantile error in constant memory."""
+    def __init__(self, sub_bucket_bits=10):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half = 1 << (sub_bucket_bits - 1)
+        self.counts = {} # Only buckets that are hit are stored
+        self.count = 0
+        # Exact integer sums, so mean and stdev carry no bucketing error.
+        self.total = 0
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        # Exact below 2**sub_bucket_bits; above, each power of two is split into
+        # 2**(sub_bucket_bits - 1) equal buckets, bounding the relative error.
+        shift = value.bit_length() - self.sub_bucket_bits
+        index = value if shift <= 0 else shift * self.half + (value >> shift)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def _bucket_value(self, index):
+        """Midpoint of the values that map to `index`."""
+        if index < 2 * self.half:
+            return index
+        shift = index // self.half - 1
+        low = (index - shift * self.half) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def _ranks(self, *ranks):
+        """Values at the given ascending 0-based ranks, in one pass over the buckets."""
+        values = []
+        pending = iter(ranks)
+        target = next(pending)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while seen > target:
+                values.append(min(max(self._bucket_value(index), self.min), self.max))
+                target = next(pending, None)
+                if target is None:
+                    return values
+        return values
+
+    def quantile(self, p):
+        if not self.count:
+            return float('nan')
+        return self._ranks(min(int(self.count * p), self.count - 1))[0] # Same rank as the exact p90/p95
+
+    def median(self):
+        """Mean of the two middle ranks (one rank when the count is odd), as np.median does."""
+        if not self.count:
+            return float('nan')
+        low, high = self._ranks((self.count - 1) // 2, self.count // 2)
+        return (low + high) / 2
+
+    def mean(self):
+        return self.total / self.count if self.count else float('nan')
+
+    def stdev(self):
+        n = self.count
+        if n < 2:
+            return 0.0
+        return ((n * self.total_sq - self.total * self.total) / (n * (n - 1))) ** 0.5
 
 def is_valid_ipv4(ip):
-    """Checks if a string is a valid IPv4 address using the ipaddress module."""
+    """Checks if a string is a valid dotted-quad IPv4 address with a single C-level parse."""
+    # inet_pton rather than inet_aton: the latter also accepts shorthand such as
+    # '10.1' and ignores anything after whitespace.
     try:
-        ipaddress.IPv4Address(ip)
+        socket.inet_pton(socket.AF_INET, ip)
         return True
-    except (ipaddress.AddressValueError, TypeError, AttributeError):
+    except (OSError, TypeError):
         return False
 
 def load_servers_from_file(filepath):
-    """Loads a list of DNS servers from a file, validating each as a valid IPv4 address."""
-    servers = []
+    """Loads unique DNS servers from a file in first-seen order, skipping invalid IPv4 addresses."""
     try:
-        with open(filepath, 'r') as f:
-            for line in f:
-                stripped = line.strip()
-                if stripped and not stripped.startswith('#'):
-                    if is_valid_ipv4(stripped):
-                        servers.append(stripped)
-                    else:
-                        print(f"{Colors.YELLOW}Warning: Skipping invalid IPv4 address '{stripped}' from {filepath}{Colors.RESET}", file=sys.stderr)
-        return servers
+        text = Path(filepath).read_text()
     except FileNotFoundError:
         print(f"{Colors.RED}Error: File not found at {filepath}{Colors.RESET}", file=sys.stderr)
         return None
+    candidates = [line for line in map(str.strip, text.splitlines()) if line and not line.startswith('#')]
+    valid, invalid = {}, {} # dicts as insertion-ordered sets
+    for line in candidates:
+        (valid if is_valid_ipv4(line) else invalid)[line] = None
+    for line in invalid:
+        print(f"{Colors.YELLOW}Warning: Skipping invalid IPv4 address '{line}' from {filepath}{Colors.RESET}", file=sys.stderr)
+    return list(valid)
 
 def load_domains_from_file(filepath):
     """Loads a list of domains from a text file."""
@@ -75,76 +178,473 @@ def load_domains_from_file(filepath):
         print(f"{Colors.RED}Error: File not found at {filepath}{Colors.RESET}", file=sys.stderr)
         return None
 
-def print_progress_bar(iteration, total, prefix='', suffix='', length=40, fill='█'):
+def get_terminal_width():
+    """Returns the terminal width in columns, or 80 if it cannot be determined."""
+    try:
+        return shutil.get_terminal_size().columns
+    except OSError:
+        return 80 # A safe default
+
+def print_progress_bar(iteration, total, prefix='', suffix='', length=40, fill='█', width=None):
     """Creates and prints a terminal progress bar that overwrites itself correctly."""
     percent_str = "{0:.1f}".format(100 * (iteration / float(total)))
     filled_length = int(length * iteration // total)
     bar = fill * filled_length + '-' * (length - filled_length)
     line_to_print = f'{prefix} |{bar}| {percent_str}% {suffix}'
-    try:
-        terminal_width = shutil.get_terminal_size().columns
-    except OSError:
-        terminal_width = 80 # A safe default
-    padded_line = line_to_print.ljust(terminal_width)
+    padded_line = line_to_print.ljust(width or get_terminal_width())
     sys.stdout.write(f'\r{padded_line}')
     sys.stdout.flush()
     if iteration == total:
         sys.stdout.write('\n')
         sys.stdout.flush()
 
-def test_dns_server(server, domains, queries, warmup_queries, timeout, lifetime, check_dnssec):
-    """Tests a single DNS server, returning detailed statistics."""
-    resolver = dns.resolver.Resolver()
-    resolver.nameservers = [server]
-    resolver.timeout = timeout
-    resolver.lifetime = lifetime
+def classify_response(rcode, ancount):
+    """Maps a response header to the error bucket the stub resolver would have raised, or None on success."""
+    if rcode == 0:
+        return None if ancount else "NoAnswer"
+    if rcode == 3:
+        return "NXDOMAIN"
+    return "NoNameservers" # SERVFAIL, REFUSED, etc. exhaust the only nameserver
+
+@lru_cache(maxsize=None)
+def build_query_wire(domain):
+    """Serializes an A query for `domain` once per process; None if the name is invalid."""
+    try:
+        return dns.message.make_query(dns.name.from_text(domain), dns.rdatatype.A).to_wire()
+    except dns.exception.DNSException:
+        return None
 
-    results = {
-        "server": server, "times": [], "successes": 0,
-        "errors": {"Timeout": 0, "NoAnswer": 0, "NoNameservers": 0, "NXDOMAIN": 0, "Other": 0},
-        "dnssec": "N/A"
+# --- Query Engines ---
+# An engine sends A queries to a single server. It is constructed as
+# Engine(server, domains, wait_time, verify_answer, window), where `window` is the
+# most queries that will be in flight at once, and `query(domain)` returns
+# (elapsed ns, error bucket or None); any exception it raises counts as "Other".
+# `verify_answer` asks for each reply to be fully parsed (after timing) and to hold
+# an A record; engines whose library always parses answers ignore it.
+class UDPQueryEngine:
+    """Sends dnspython-built queries over one connected, non-blocking UDP socket, matched by transaction ID."""
+    def __init__(self, server, domains, wait_time, verify_answer=False, window=QUERY_WINDOW):
+        self.wait_time = wait_time
+        self.verify_answer = verify_answer
+        self.loop = asyncio.get_running_loop()
+        # txid -> future resolved with (receive time in ns, rcode, ancount, reply if verifying),
+        # None on timeout, or False once the server has refused
+        self.pending = {}
+        self.refused = False
+        # Every query waits the same wait_time, so deadlines queue up already sorted
+        # and a single timer armed for the oldest one replaces a timer per query.
+        self.deadlines = deque() # (deadline, txid, future) in send order
+        self.expiry_timer = None
+        self.txids = self._random_txids()
+        self.query_wires = {domain: build_query_wire(domain) for domain in domains}
+        self.recv_buf = bytearray(4096) # Reused for every reply instead of a fresh bytes object each
+        # One socket for the whole test: no socket()/close() per query.
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setblocking(False)
+            # Connected, so the kernel drops datagrams from other sources and reports
+            # an ICMP port-unreachable as ConnectionRefusedError.
+            self.sock.connect((server, DNS_PORT))
+            self.loop.add_reader(self.sock.fileno(), self._on_readable)
+        except Exception:
+            self.sock.close() # close() is never reached if construction fails
+            raise
+
+    def _random_txids(self):
+        """Yields random 16-bit IDs drawn from os.urandom in bulk, skipping any still in flight."""
+        while True:
+            for txid in struct.unpack(f'>{TXID_BATCH}H', os.urandom(2 * TXID_BATCH)):
+                if txid not in self.pending:
+                    yield txid
+
+    def _expire(self):
+        self.expiry_timer = None
+        now = self.loop.time()
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _, txid, future = deadlines.popleft()
+            if not future.done():
+                if self.pending.get(txid) is future:
+                    del self.pending[txid]
+                future.set_result(None)
+        if deadlines:
+            self.expiry_timer = self.loop.call_at(deadlines[0][0], self._expire)
+
+    def _refuse(self):
+        """Fails every pending and later query as "Other" once the server's port is reported closed."""
+        self.refused = True
+        for future in self.pending.values():
+            if not future.done():
+                future.set_result(False)
+        self.pending.clear()
+
+    def _on_readable(self):
+        # Bound to locals: this drains every queued reply in one callback.
+        recv_into, pop_pending = self.sock.recv_into, self.pending.pop
+        unpack_from, perf_counter_ns = struct.unpack_from, time.perf_counter_ns
+        buf = self.recv_buf
+        view = memoryview(buf)
+        keep_reply = self.verify_answer
+        while True:
+            try:
+                nbytes = recv_into(buf)
+            except ConnectionRefusedError: # ICMP port unreachable
+                self._refuse()
+                return
+            except OSError: # BlockingIOError once drained, or another reported ICMP error
+                return
+            if nbytes < 12:
+                continue
+            # ID, flags and ANCOUNT straight from the header; no RR parsing or slice copy.
+            txid, flags, ancount = unpack_from('>HHxxH', buf)
+            if not flags & 0x8000: # QR bit clear: not a response, so it cannot answer our query
+                continue
+            future = pop_pending(txid, None)
+            if future is not None and not future.done():
+                # The buffer is overwritten by the next reply, so copy it out only if it will be parsed.
+                reply = bytes(view[:nbytes]) if keep_reply else None
+                future.set_result((perf_counter_ns(), flags & 0xF, ancount, reply))
+
+    async def query(self, domain):
+        if self.query_wires[domain] is None:
+            raise ValueError(f"Invalid domain name: {domain!r}")
+        if self.refused:
+            return None, "Other"
+        txid = next(self.txids)
+        wire = bytearray(self.query_wires[domain])
+        struct.pack_into('>H', wire, 0, txid)
+        future = self.loop.create_future()
+        self.pending[txid] = future
+        try:
+            start_ns = time.perf_counter_ns()
+            try:
+                self.sock.send(wire)
+            except ConnectionRefusedError: # An earlier query's ICMP error, reported on this send
+                self._refuse()
+                return None, "Other"
+            self.deadlines.append((self.loop.time() + self.wait_time, txid, future))
+            if self.expiry_timer is None:
+                self.expiry_timer = self.loop.call_at(self.deadlines[0][0], self._expire)
+            result = await future
+        finally:
+            if self.pending.get(txid) is future:
+                del self.pending[txid]
+        if result is None:
+            return None, "Timeout"
+        if result is False:
+            return None, "Other"
+        end_ns, rcode, ancount, reply = result
+        error = classify_response(rcode, ancount)
+        if error is None and self.verify_answer:
+            error = self._check_answer(reply) # Parsed after the clock stopped
+        return end_ns - start_ns, error
+
+    @staticmethod
+    def _check_answer(reply):
+        """Fully parses a reply, returning an error bucket unless it contains an A record."""
+        try:
+            response = dns.message.from_wire(reply)
+        except dns.exception.DNSException:
+            return "Other"
+        return None if any(rrset.rdtype == dns.rdatatype.A for rrset in response.answer) else "NoAnswer"
+
+    async def close(self):
+        if self.expiry_timer is not None:
+            self.expiry_timer.cancel()
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+class ResolverQueryEngine:
+    """Resolves through dnspython's full async stub resolver, as dnspython applications do."""
+    # Exact exception type -> error bucket, looked up once instead of walking an except chain.
+    error_map = {
+        dns.resolver.Timeout: "Timeout",
+        dns.resolver.NoAnswer: "NoAnswer",
+        dns.resolver.NoNameservers: "NoNameservers",
+        dns.resolver.NXDOMAIN: "NXDOMAIN",
     }
 
-    if check_dnssec:
+    def __init__(self, server, domains, wait_time, verify_answer=False, window=QUERY_WINDOW):
+        self.resolver = dns.asyncresolver.Resolver(configure=False) # No resolv.conf read per server
+        self.resolver.nameservers = [server]
+        self.resolver.timeout = wait_time
+        self.resolver.lifetime = wait_time
+        # Pinned explicitly rather than relying on configure=False's defaults: one
+        # absolute name per query, no hidden SERVFAIL retries and no cache, so
+        # every sample is exactly one round trip to this server.
+        self.resolver.search = []
+        self.resolver.use_search_by_default = False
+        self.resolver.retry_servfail = False
+        self.resolver.rotate = False
+        self.resolver.cache = None
+        self.resolve = self.resolver.resolve
+
+    async def query(self, domain):
+        perf_counter_ns = time.perf_counter_ns
+        start_ns = perf_counter_ns()
         try:
-            qname = dns.name.from_text('internic.net')
-            q = dns.message.make_query(qname, dns.rdatatype.A, want_dnssec=True)
-            response = dns.query.udp(q, server, timeout=timeout)
-            results["dnssec"] = bool(response.flags & dns.flags.AD)
-        except Exception:
-            try: # Fallback to TCP
-                response = dns.query.tcp(q, server, timeout=timeout)
-                results["dnssec"] = bool(response.flags & dns.flags.AD)
+            await self.resolve(domain, dns.rdatatype.A) # Enum, so no per-call text lookup
+        except Exception as exc:
+            return None, self.error_map.get(type(exc), "Other")
+        return perf_counter_ns() - start_ns, None
+
+    async def close(self):
+        pass
+
+class AiodnsQueryEngine:
+    """Resolves through c-ares via aiodns, keeping socket handling and parsing in C."""
+    def __init__(self, server, domains, wait_time, verify_answer=False, window=QUERY_WINDOW):
+        import aiodns # Optional, so imported here; other engines never load it
+        import aiodns.error
+        self.dns_error = aiodns.error.DNSError
+        self.resolver = aiodns.DNSResolver(nameservers=[server], timeout=wait_time, tries=1)
+        # query_dns() replaces the deprecated query() in aiodns 4.
+        self.resolve = getattr(self.resolver, 'query_dns', self.resolver.query)
+        self.error_map = {
+            aiodns.error.ARES_ETIMEOUT: "Timeout",
+            aiodns.error.ARES_ENODATA: "NoAnswer",
+            aiodns.error.ARES_ENOTFOUND: "NXDOMAIN",
+            aiodns.error.ARES_ESERVFAIL: "NoNameservers",
+            aiodns.error.ARES_EREFUSED: "NoNameservers",
+        }
+
+    async def query(self, domain):
+        start_ns = time.perf_counter_ns()
+        try:
+            await self.resolve(domain, 'A')
+        except self.dns_error as e:
+            return None, self.error_map.get(e.args[0], "Other")
+        return time.perf_counter_ns() - start_ns, None
+
+    async def close(self):
+        # close() is a coroutine in aiodns 4, a plain method in 3.x, and absent before that.
+        close = getattr(self.resolver, 'close', None)
+        result = close() if close is not None else None
+        if asyncio.iscoroutine(result):
+            await result
+
+class GetaddrinfoQueryEngine:
+    """Resolves through the system's getaddrinfo() on a fixed pool of daemon threads; `server` is only a label."""
+    error_map = {socket.EAI_NONAME: "NXDOMAIN", socket.EAI_AGAIN: "Timeout", socket.EAI_FAIL: "NoNameservers"}
+    if hasattr(socket, 'EAI_NODATA'): # Not defined on every platform
+        error_map[socket.EAI_NODATA] = "NoAnswer"
+
+    def __init__(self, server, domains, wait_time, verify_answer=False, window=QUERY_WINDOW):
+        self.loop = asyncio.get_running_loop()
+        self.wait_time = wait_time
+        self.jobs = queue.SimpleQueue() # (domain, future), or None to stop one worker
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(window)]
+        for worker in self.workers:
+            worker.start()
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            domain, future = job
+            if future.done(): # Timed out while queued behind stalled lookups
+                continue
+            # Timed inside the worker so waiting in the queue is not counted.
+            start_ns = time.perf_counter_ns()
+            try:
+                socket.getaddrinfo(domain, None, socket.AF_INET, socket.SOCK_DGRAM)
+                result = (time.perf_counter_ns() - start_ns, None)
+            except socket.gaierror as e:
+                result = (None, self.error_map.get(e.errno, "Other"))
             except Exception:
-                results["dnssec"] = False
+                result = (None, "Other")
+            try:
+                self.loop.call_soon_threadsafe(_resolve_future, future, result)
+            except RuntimeError: # The loop closed while this lookup was still running
+                return
+
+    async def query(self, domain):
+        # getaddrinfo cannot be cancelled: a lookup past wait_time counts as a Timeout
+        # and finishes on its worker, which as a daemon never delays exit.
+        future = self.loop.create_future()
+        self.jobs.put((domain, future))
+        try:
+            return await asyncio.wait_for(future, self.wait_time)
+        except asyncio.TimeoutError:
+            return None, "Timeout"
+
+    async def close(self):
+        for _ in self.workers:
+            self.jobs.put(None) # Idle workers exit; one stuck in getaddrinfo exits when it returns
+
+def _resolve_future(future, result):
+    """Sets `result` on `future` unless it was already cancelled (e.g. by a timeout)."""
+    if not future.done():
+        future.set_result(result)
+
+QUERY_ENGINES = {
+    'dnspython': UDPQueryEngine, 'resolver': ResolverQueryEngine,
+    'aiodns': AiodnsQueryEngine, 'getaddrinfo': GetaddrinfoQueryEngine,
+}
+
+_dnssec_cache = {} # server -> probe result, shared by every run in this process
+
+async def probe_dnssec(server, timeout):
+    """Checks (once per server) whether a server sets the AD flag on a DNSSEC-signed answer, falling back to TCP."""
+    if server in _dnssec_cache:
+        return _dnssec_cache[server]
+    qname = dns.name.from_text('internic.net')
+    q = dns.message.make_query(qname, dns.rdatatype.A, want_dnssec=True)
+    try:
+        response = await dns.asyncquery.udp(q, server, timeout=timeout)
+        supported = bool(response.flags & dns.flags.AD)
+    except Exception:
+        try: # Fallback to TCP
+            response = await dns.asyncquery.tcp(q, server, timeout=timeout)
+            supported = bool(response.flags & dns.flags.AD)
+        except Exception:
+            supported = False
+    _dnssec_cache[server] = supported
+    return supported
+
+async def probe_dnssec_all(servers, timeout):
+    """Probes every server for DNSSEC support in one concurrent batch, returning {server: bool}."""
+    results = await asyncio.gather(*(probe_dnssec(s, timeout) for s in servers), return_exceptions=True)
+    return {server: result is True for server, result in zip(servers, results)}
+
+async def test_dns_server(server, domains, queries, warmup_queries, timeout, lifetime, keep_samples=False, in_flight=None, engine='dnspython', verify_answer=False, on_query_done=None, window=QUERY_WINDOW):
+    """Tests a single DNS server, returning detailed statistics."""
+    # With keep_samples every latency is kept in "times" (int64 ns) for exact
+    # statistics; otherwise they are summarised in "histogram".
+    results = {
+        "server": server, "times": None, "successes": 0,
+        "histogram": LatencyHistogram(),
+        "errors": {"Timeout": 0, "NoAnswer": 0, "NoNameservers": 0, "NXDOMAIN": 0, "Other": 0}
+    }
 
-    if warmup_queries > 0 and domains:
-        for _ in range(warmup_queries):
+    # Each query is a single attempt bounded by both the timeout and the lifetime.
+    querier = QUERY_ENGINES[engine](server, domains, min(timeout, lifetime), verify_answer, window)
+    server_window = asyncio.Semaphore(window)
+    in_flight = in_flight or asyncio.Semaphore(window)
+
+    async def timed_query(domain):
+        async with server_window, in_flight:
+            return await querier.query(domain)
+
+    tasks = []
+    try:
+        if warmup_queries > 0 and domains:
+            # One concurrent burst, capped at `lifetime` in total so a dead server
+            # cannot stall for warmup_queries * lifetime before the timed phase.
+            warmup = asyncio.gather(*(querier.query(domains[0]) for _ in range(warmup_queries)), return_exceptions=True)
             try:
-                resolver.resolve(domains[0], "A")
-            except Exception:
+                await asyncio.wait_for(warmup, timeout=lifetime)
+            except asyncio.TimeoutError:
                 pass
 
-    for domain in domains:
-        for _ in range(queries):
+        # The sample count is known up front, so samples fill a preallocated array.
+        # Allocated before any query is scheduled, so a failure here leaves nothing running.
+        if keep_samples:
+            import numpy as np # Only --keep-samples needs numpy; skip its import cost otherwise
+            times = np.empty(len(domains) * queries, dtype=np.int64)
+        else:
+            times = None
+        tasks = [asyncio.create_task(timed_query(domain)) for domain in domains for _ in range(queries)]
+        if on_query_done is not None:
+            for task in tasks:
+                task.add_done_callback(on_query_done)
+        # Local bindings keep dict and attribute lookups out of the per-query path.
+        errors = results["errors"]
+        record = results["histogram"].record
+        successes = 0
+        for task in tasks:
             try:
-                start_time = time.perf_counter()
-                resolver.resolve(domain, "A")
-                end_time = time.perf_counter()
-                results["times"].append((end_time - start_time) * 1000)
-                results["successes"] += 1
-            except dns.resolver.Timeout:
-                results["errors"]["Timeout"] += 1
-            except dns.resolver.NoAnswer:
-                results["errors"]["NoAnswer"] += 1
-            except dns.resolver.NoNameservers:
-                results["errors"]["NoNameservers"] += 1
-            except dns.resolver.NXDOMAIN:
-                results["errors"]["NXDOMAIN"] += 1
+                elapsed_ns, error = await task
             except Exception:
-                results["errors"]["Other"] += 1
+                errors["Other"] += 1
+                continue
+            if error is None:
+                if times is not None:
+                    times[successes] = elapsed_ns
+                else:
+                    record(elapsed_ns)
+                successes += 1
+            else:
+                errors[error] += 1
+        results["successes"] = successes
+        if times is not None:
+            results["times"] = times[:successes] # A view, not a copy
+    finally:
+        # Stop any queries still running before their engine's socket goes away.
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        await querier.close()
     return results
 
+async def run_all_tests(servers, domains, config):
+    """Tests all servers concurrently on a single event loop, at most `config.workers` at a time."""
+    semaphore = asyncio.Semaphore(config.workers)
+    in_flight = asyncio.Semaphore(config.concurrency)
+
+    total_queries = len(servers) * len(domains) * config.queries
+    done_queries = 0
+    last_draw = 0.0
+    # The width is looked up once, and again only when the terminal is resized.
+    width = get_terminal_width()
+
+    def on_resize():
+        nonlocal width
+        width = get_terminal_width()
+
+    loop = asyncio.get_running_loop()
+    watch_resize = hasattr(signal, 'SIGWINCH')
+    if watch_resize:
+        try:
+            loop.add_signal_handler(signal.SIGWINCH, on_resize)
+        except (NotImplementedError, RuntimeError, ValueError):
+            watch_resize = False
+
+    def query_done(_task):
+        # Progress counts individual queries, so one slow server cannot freeze the bar.
+        # Redraws are rate-limited so fast runs do not spend their time repainting.
+        nonlocal done_queries, last_draw
+        done_queries += 1
+        now = time.monotonic()
+        if now - last_draw >= PROGRESS_INTERVAL and done_queries < total_queries:
+            last_draw = now
+            print_progress_bar(done_queries, total_queries, prefix='Progress:', suffix='Complete', length=50, width=width)
+
+    async def run_one(server):
+        async with semaphore:
+            try:
+                raw = await test_dns_server(server, domains, config.queries, config.warmup_queries, config.timeout, config.lifetime, config.keep_samples, in_flight, config.engine, config.verify_answer, query_done, config.window)
+                return server, raw, None
+            except Exception as exc:
+                return server, None, exc
+
+    # Every DNSSEC probe goes out in one batch as the tests start and is collected
+    # at the end, so the probes' round trips (and TCP fallbacks) overlap the timed
+    # queries instead of delaying them.
+    dnssec_probes = asyncio.create_task(probe_dnssec_all(servers, config.timeout)) if config.dnssec else None
+    all_stats = []
+    print_progress_bar(0, max(total_queries, 1), prefix='Progress:', suffix='Complete', length=50, width=width)
+
+    try:
+        for next_done in asyncio.as_completed([run_one(s) for s in servers]):
+            server, raw, exc = await next_done
+            if exc is None:
+                all_stats.append(process_results(raw))
+            else:
+                print(f"\n{Colors.RED}Server {server} generated an exception: {exc}{Colors.RESET}", file=sys.stderr)
+    finally:
+        if watch_resize:
+            loop.remove_signal_handler(signal.SIGWINCH)
+    if dnssec_probes:
+        dnssec_map = await dnssec_probes
+        for stats in all_stats:
+            stats['dnssec'] = dnssec_map[stats['server']]
+    # Drawn once here so the bar always finishes, even if a server failed before queuing its queries.
+    print_progress_bar(1, 1, prefix='Progress:', suffix='Complete', length=50, width=width)
+    return all_stats
+
 def process_results(results):
     """Calculates statistics from raw test results."""
     stats = {"server": results["server"]}
@@ -152,17 +652,31 @@ def process_results(results):
     total_attempts = results["successes"] + total_failures
     stats['success_rate'] = (results["successes"] / total_attempts) if total_attempts > 0 else 0.0
 
-    if results["times"]:
-        stats['avg'] = statistics.mean(results["times"])
-        stats['median'] = statistics.median(results["times"])
-        stats['stdev'] = statistics.stdev(results["times"]) if len(results["times"]) > 1 else 0.0
-        sorted_times = sorted(results["times"])
-        p90_index = min(int(len(sorted_times) * 0.90), len(sorted_times) - 1)
-        p95_index = min(int(len(sorted_times) * 0.95), len(sorted_times) - 1)
-        stats['p90'] = sorted_times[p90_index]
-        stats['p95'] = sorted_times[p95_index]
+    if results["times"] is not None and len(results["times"]):
+        # Exact statistics over every retained sample (--keep-samples).
+        import numpy as np # Already loaded by test_dns_server when samples were kept
+        times = np.true_divide(results["times"], 1e6) # Integer ns -> float64 ms in one pass, one allocation
+        stats['avg'] = float(times.mean())
+        stats['median'] = float(np.median(times))
+        stats['stdev'] = float(times.std(ddof=1)) if times.size > 1 else 0.0
+        # Percentiles only need one O(n) partial partition, not a full sort. The
+        # ranks match the histogram's min(int(n * p), n - 1), so both paths agree.
+        n = times.size
+        p90_i, p95_i = min(int(n * 0.90), n - 1), min(int(n * 0.95), n - 1)
+        partitioned = np.partition(times, [p90_i, p95_i])
+        stats['p90'] = float(partitioned[p90_i])
+        stats['p95'] = float(partitioned[p95_i])
+    elif results["successes"]:
+        # Integer ns -> ms, keeping the same key order as the exact path for CSV columns
+        hist = results["histogram"]
+        stats['avg'] = hist.mean() / 1e6
+        stats['median'] = hist.median() / 1e6
+        stats['stdev'] = hist.stdev() / 1e6
+        stats['p90'] = hist.quantile(0.90) / 1e6
+        stats['p95'] = hist.quantile(0.95) / 1e6
     else:
-        stats.update({'avg': float('inf'), 'median': float('inf'), 'stdev': float('inf'), 'p90': float('inf'), 'p95': float('inf')})
+        # No successful queries: None marks the server as failed (null in JSON, empty in CSV).
+        stats.update({'avg': None, 'median': None, 'stdev': None, 'p90': None, 'p95': None})
 
     stats.update(results["errors"])
     stats['dnssec'] = results.get('dnssec', 'N/A')
@@ -214,46 +728,37 @@ def display_table(stats_list, show_dnssec, unreliable_servers):
         print("-" * (len(header) + 20))
 
         ANSI_LEN = len(Colors.GREEN) + len(Colors.RESET)
-
+        W_RATE, W_TIME = 10 + ANSI_LEN, 18 + ANSI_LEN
+
+        # Row templates and constant cells are built once per table, not per row.
+        # Per-row colored cells carry ANSI_LEN invisible characters, hence the wider
+        # fields; constant cells are padded inside their color codes instead, so
+        # they line up whether or not they are colored.
+        tail_fmt = (" {}" if show_dnssec else "") + " {:<10}"
+        row_fmt = f"{{:<5}} {{:<18}} {{:<{W_RATE}}} {{:<{W_TIME}}} {{:<{W_TIME}}} {{:<{W_TIME}}} {{:<{W_TIME}}} {{:<12.2f}}{tail_fmt}"
+        failed_str = f"{Colors.RED}{'Failed':<18}{Colors.RESET}"
+        na_str = f"{Colors.RED}{'N/A':<12}{Colors.RESET}"
+        failed_fmt = f"{{:<5}} {{:<18}} {{:<{W_RATE}}} {failed_str} {failed_str} {failed_str} {failed_str} {na_str}{tail_fmt}"
+        dnssec_cells = {True: f"{Colors.GREEN}{'Yes':<10}{Colors.RESET}", False: f"{Colors.RED}{'No':<10}{Colors.RESET}"}
+        dnssec_na = f"{'N/A':<10}"
+        # Without colors there is nothing to choose between, so skip colorize_time's branches.
+        fmt_time = colorize_time if Colors.GREEN else "{:.2f}".format
+
+        lines = []
         for i, stats in enumerate(stats_list, 1):
-            if stats['avg'] == float('inf'):
-                failed_str = f"{Colors.RED}Failed{Colors.RESET}".ljust(18 + ANSI_LEN)
-                na_str = f"{Colors.RED}N/A{Colors.RESET}".ljust(12 + ANSI_LEN)
-                line = (f"{i:<5} {stats['server']:<18} "
-                        f"{colorize_success_rate(stats['success_rate']):<{10 + ANSI_LEN}} "
-                        f"{failed_str} {failed_str} {failed_str} {failed_str} {na_str}")
-            else:
-                rank_str = f"{i:<5}"
-                server_ip = f"{stats['server']:<18}"
-                success_str = colorize_success_rate(stats['success_rate'])
-                avg_str = colorize_time(stats['avg'])
-                median_str = colorize_time(stats['median'])
-                p90_str = colorize_time(stats['p90'])
-                p95_str = colorize_time(stats['p95'])
-                stdev_str = f"{stats['stdev']:.2f}"
-
-                line = (f"{rank_str} "
-                        f"{server_ip} "
-                        f"{success_str:<{10 + ANSI_LEN}} "
-                        f"{avg_str:<{18 + ANSI_LEN}} "
-                        f"{median_str:<{18 + ANSI_LEN}} "
-                        f"{p90_str:<{18 + ANSI_LEN}} "
-                        f"{p95_str:<{18 + ANSI_LEN}} "
-                        f"{stdev_str:<12}")
-
+            success_str = colorize_success_rate(stats['success_rate'])
             if show_dnssec:
-                dnssec_status = stats.get('dnssec')
-                if dnssec_status is True:
-                    dnssec_str = f"{Colors.GREEN}Yes{Colors.RESET}"
-                elif dnssec_status is False:
-                    dnssec_str = f"{Colors.RED}No{Colors.RESET}"
-                else:
-                    dnssec_str = "N/A"
-                line += f" {dnssec_str:<{10 + ANSI_LEN}}"
-
-            timeouts_str = f"{stats['Timeout']}"
-            line += f" {timeouts_str:<10}"
-            print(line)
+                tail = (dnssec_cells.get(stats.get('dnssec'), dnssec_na), stats['Timeout'])
+            else:
+                tail = (stats['Timeout'],)
+            if stats['avg'] is None:
+                line = failed_fmt.format(i, stats['server'], success_str, *tail)
+            else:
+                line = row_fmt.format(i, stats['server'], success_str,
+                                      fmt_time(stats['avg']), fmt_time(stats['median']),
+                                      fmt_time(stats['p90']), fmt_time(stats['p95']), stats['stdev'], *tail)
+            lines.append(line)
+        print("\n".join(lines))
 
     if unreliable_servers:
         print(f"\n{Colors.YELLOW}Note: {len(unreliable_servers)} unreliable server(s) were hidden due to low success rates.{Colors.RESET}")
@@ -263,10 +768,12 @@ def output_csv(stats_list, filename):
     """Outputs the results to a CSV file."""
     if not stats_list: return
     try:
+        fieldnames = list(stats_list[0])
+        rows = [[stats.get(k, '') for k in fieldnames] for stats in stats_list]
         with open(filename, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=stats_list[0].keys())
-            writer.writeheader()
-            writer.writerows(stats_list)
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            writer.writerows(rows)
         print(f"\nResults saved to {filename}")
     except IOError as e:
         print(f"{Colors.RED}Error writing to CSV file {filename}: {e}{Colors.RESET}", file=sys.stderr)
@@ -274,8 +781,13 @@ def output_csv(stats_list, filename):
 def output_json(stats_list, filename):
     """Outputs the results to a JSON file."""
     try:
-        with open(filename, 'w') as f:
-            json.dump(stats_list, f, indent=4)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                # OPT_SERIALIZE_NUMPY lets any numpy scalar that reaches the stats through natively.
+                f.write(orjson.dumps(stats_list, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(filename, 'w') as f:
+                json.dump(stats_list, f, indent=4)
         print(f"\nResults saved to {filename}")
     except IOError as e:
         print(f"{Colors.RED}Error writing to JSON file {filename}: {e}{Colors.RESET}", file=sys.stderr)
@@ -307,7 +819,9 @@ def interactive_setup():
             domains_list=DEFAULT_DOMAINS,
             queries=5 if use_quick_servers else 10,
             warmup_queries=1,
-            workers=10,
+            workers=64,
+            concurrency=256,
+            window=QUERY_WINDOW,
             timeout=3.0,
             lifetime=3.0,
             dnssec=check_dnssec,
@@ -315,7 +829,11 @@ def interactive_setup():
             output_format='table',
             output_file=None,
             no_color=False,
-            show_unreliable=False
+            show_unreliable=False,
+            keep_samples=False,
+            engine='dnspython',
+            verify_answer=False,
+            pin_cpu=None
         )
     except KeyboardInterrupt:
         print("\nTest interrupted by user.")
@@ -344,9 +862,15 @@ def main():
     group_advanced = parser.add_argument_group('Advanced & Performance')
     group_advanced.add_argument('--quick', action='store_true', help="Perform a quick test using only major providers (Google, Cloudflare, Quad9).")
     group_advanced.add_argument('--warmup-queries', type=int, default=1, help="Untimed queries before testing to warm up the cache. (Default: 1)")
-    group_advanced.add_argument('-w', '--workers', type=int, default=10, help="Number of concurrent workers for testing. (Default: 10)")
+    group_advanced.add_argument('-w', '--workers', type=int, default=64, help="Number of servers tested concurrently. (Default: 64)")
+    group_advanced.add_argument('--window', type=int, default=QUERY_WINDOW, help=f"Timed queries in flight to each server at once. Latency is measured while\npipelining this many; use 1 to send them one at a time. (Default: {QUERY_WINDOW})")
+    group_advanced.add_argument('-c', '--concurrency', type=int, default=256, help="Maximum number of queries in flight across all servers. (Default: 256)")
     group_advanced.add_argument('-t', '--timeout', type=float, default=3.0, help="DNS query timeout in seconds. Increase if on a slow network. (Default: 3.0)")
     group_advanced.add_argument('-l', '--lifetime', type=float, default=3.0, help="Total time for a query attempt in seconds. (Default: 3.0)")
+    group_advanced.add_argument('--engine', choices=list(QUERY_ENGINES), default='dnspython', help="Query engine. 'dnspython' sends raw UDP queries (default);\n'resolver' uses dnspython's full async stub resolver;\n'aiodns' resolves through the c-ares C library (pip install aiodns);\n'getaddrinfo' tests the operating system's resolver and ignores --servers.")
+    group_advanced.add_argument('--verify-answer', action='store_true', help="Fully parse each reply and require an A record, instead of\ntrusting the response header (parsing happens after timing stops).")
+    group_advanced.add_argument('--pin-cpu', type=int, metavar='CPU', help="Pin the test process to one CPU core to avoid scheduler migrations (Linux only).")
+    group_advanced.add_argument('--keep-samples', action='store_true', help="Keep every query's latency for exact median/p90/p95 instead of\nconstant-memory streaming estimates (uses more memory on large runs).")
 
     if len(sys.argv) == 1:
         config = interactive_setup()
@@ -354,6 +878,20 @@ def main():
         config = parser.parse_args()
         if config.output_format in ('json', 'csv') and not config.output_file:
             parser.error('--output-file is required for JSON or CSV output.')
+        if config.workers < 1:
+            parser.error('--workers must be at least 1.')
+        if config.concurrency < 1:
+            parser.error('--concurrency must be at least 1.')
+        if config.window < 1:
+            parser.error('--window must be at least 1.')
+        if config.keep_samples and find_spec('numpy') is None:
+            parser.error("--keep-samples requires the 'numpy' package (pip install numpy).")
+        if config.engine == 'aiodns' and find_spec('aiodns') is None:
+            parser.error("--engine aiodns requires the 'aiodns' package (pip install aiodns).")
+        if config.engine == 'getaddrinfo' and config.dnssec:
+            parser.error('--dnssec needs server addresses and cannot be used with --engine getaddrinfo.')
+        if config.pin_cpu is not None and not hasattr(os, 'sched_setaffinity'):
+            parser.error('--pin-cpu is only supported on Linux.')
 
     setup_colors(config.no_color)
 
@@ -361,7 +899,10 @@ def main():
         servers = config.servers_list
         domains = config.domains_list
     else:
-        if config.quick:
+        if config.engine == 'getaddrinfo':
+            servers = [SYSTEM_RESOLVER]
+            print(f"{Colors.CYAN}Using --engine getaddrinfo: testing the system resolver; --servers and --quick are ignored.{Colors.RESET}")
+        elif config.quick:
             servers = QUICK_DNS_SERVERS
             print(f"{Colors.CYAN}Running in --quick mode, testing {len(servers)} major DNS providers.{Colors.RESET}")
         else:
@@ -377,47 +918,45 @@ def main():
     if config.dnssec: print("DNSSEC validation check enabled.")
     print(f"Total timed queries: {total_queries} using {config.workers} workers.")
 
-    all_stats = []
+    if config.pin_cpu is not None:
+        try:
+            os.sched_setaffinity(0, {config.pin_cpu})
+        except OSError as e:
+            print(f"{Colors.YELLOW}Warning: Could not pin to CPU {config.pin_cpu}: {e}{Colors.RESET}", file=sys.stderr)
+
+    if sys.platform == 'win32':
+        # The raw UDP path relies on add_reader, which the default Proactor loop lacks.
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    elif uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     try:
-        with ThreadPoolExecutor(max_workers=config.workers) as executor:
-            future_to_server = { executor.submit(test_dns_server, s, domains, config.queries, config.warmup_queries, config.timeout, config.lifetime, config.dnssec): s for s in servers }
-            
-            completed = 0
-            total_servers = len(servers)
-            print_progress_bar(completed, total_servers, prefix='Progress:', suffix='Complete', length=50)
-
-            for future in as_completed(future_to_server):
-                server = future_to_server[future]
-                try:
-                    stats = process_results(future.result())
-                    all_stats.append(stats)
-                except Exception as exc:
-                    print(f"\n{Colors.RED}Server {server} generated an exception: {exc}{Colors.RESET}", file=sys.stderr)
-                finally:
-                    completed += 1
-                    suffix = f"({server:<15.15} done)"
-                    print_progress_bar(completed, total_servers, prefix='Progress:', suffix=suffix, length=50)
+        all_stats = asyncio.run(run_all_tests(servers, domains, config))
     except KeyboardInterrupt:
         print("\nTest interrupted by user.")
         sys.exit(1)
 
-    reliable_stats = sorted([s for s in all_stats if s['success_rate'] >= RELIABILITY_THRESHOLD], key=lambda item: item['avg'])
-    unreliable_stats = [s for s in all_stats if s['success_rate'] < RELIABILITY_THRESHOLD]
+    # Only servers with timings are sorted; failed ones always go last.
+    ok_stats = [s for s in all_stats if s['avg'] is not None]
+    failed_stats = [s for s in all_stats if s['avg'] is None]
+    ok_stats.sort(key=itemgetter('avg'))
+    ranked_stats = ok_stats + failed_stats
+    reliable_stats = [s for s in ranked_stats if s['success_rate'] >= RELIABILITY_THRESHOLD]
+    unreliable_stats = [s for s in ranked_stats if s['success_rate'] < RELIABILITY_THRESHOLD]
 
     if config.simple:
         display_simple_output(reliable_stats, config.dnssec)
     elif config.output_format == 'table':
         stats_to_display = reliable_stats
         if config.show_unreliable:
-            stats_to_display = sorted(all_stats, key=lambda item: (item['success_rate'] < RELIABILITY_THRESHOLD, item['avg']))
+            stats_to_display = reliable_stats + unreliable_stats
         display_table(stats_to_display, config.dnssec, unreliable_stats if not config.show_unreliable else [])
         display_simple_output(reliable_stats, config.dnssec)
     elif config.output_format in ['csv', 'json']:
-        output_stats = sorted(all_stats, key=lambda item: item['avg'])
         if config.output_format == 'csv':
-            output_csv(output_stats, config.output_file)
+            output_csv(ranked_stats, config.output_file)
         elif config.output_format == 'json':
-            output_json(output_stats, config.output_file)
+            output_json(ranked_stats, config.output_file)
 
 if __name__ == "__main__":
     main()
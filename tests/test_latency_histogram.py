@@ -0,0 +1,51 @@
+import math
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dns_speed_test import LatencyHistogram
+
+REL_BOUND = 2 ** -10 # Documented quantile error at the default sub_bucket_bits
+
+
+def recorded(samples):
+    hist = LatencyHistogram()
+    for value in samples:
+        hist.record(value)
+    return hist
+
+
+@pytest.mark.parametrize("scale", [1e3, 1e6, 1e9]) # ~1 us, ~1 ms, ~1 s in ns
+@pytest.mark.parametrize("n", [1, 2, 3, 10, 101, 1000])
+def test_matches_numpy(scale, n):
+    rng = random.Random(f"{scale}-{n}")
+    samples = [max(1, int(rng.lognormvariate(0, 1) * scale)) for _ in range(n)]
+    hist = recorded(samples)
+    ordered = np.sort(samples)
+
+    assert hist.median() == pytest.approx(np.median(ordered), rel=REL_BOUND)
+    for p in (0.90, 0.95):
+        exact = ordered[min(int(n * p), n - 1)] # Rank used by the --keep-samples path
+        assert hist.quantile(p) == pytest.approx(exact, rel=REL_BOUND)
+    assert hist.mean() == pytest.approx(np.mean(samples), rel=1e-12)
+    expected_stdev = float(np.std(samples, ddof=1)) if n > 1 else 0.0
+    assert hist.stdev() == pytest.approx(expected_stdev, rel=1e-9)
+
+
+def test_small_values_are_exact():
+    samples = [5, 7, 7, 900, 1000, 3]
+    hist = recorded(samples)
+    assert hist.median() == np.median(samples)
+    assert hist.quantile(0.9) == sorted(samples)[5]
+
+
+def test_empty():
+    hist = LatencyHistogram()
+    assert math.isnan(hist.median())
+    assert math.isnan(hist.quantile(0.9))
+    assert math.isnan(hist.mean())
+    assert hist.stdev() == 0.0